@@ -1,14 +1,71 @@
 import sys
 import os
+
+# -------------------------------------------------------------------
+# 0. TORCH RUNTIME CONFIG (must be set before torch is imported)
+# -------------------------------------------------------------------
+# Persist compiled Inductor kernels across restarts
+os.environ.setdefault(
+    "TORCHINDUCTOR_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".inductor_cache")
+)
+# Less CUDA memory fragmentation in a long-running server
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+# Match the container's vCPUs instead of oversubscribing (override with CPU_THREADS)
+def cpu_budget():
+    """
+    CPUs this process may actually use: the affinity mask, capped by the
+    cgroup CPU quota (a quota-limited container still sees every host core).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:              # cgroup v2
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:   # cgroup v1
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+
+    if quota not in (None, "max", "-1") and period:
+        cpus = min(cpus, max(1, -(-int(quota) // int(period))))  # ceil(quota / period)
+    return cpus
+
+CPU_THREADS = int(os.environ.get("CPU_THREADS", cpu_budget()))
+os.environ.setdefault("OMP_NUM_THREADS", str(CPU_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(CPU_THREADS))
+
+import asyncio
+import base64
 import shutil
 import tempfile
 import torch
 import uvicorn
 import threading
 import time
-from fastapi import FastAPI, File, UploadFile
+import uuid
+from collections import OrderedDict
+
+torch.set_num_threads(CPU_THREADS)
+torch.set_num_interop_threads(1)
+
+from fastapi import FastAPI, File, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+try:
+    import orjson  # noqa: F401  (required by ORJSONResponse)
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
 # -------------------------------------------------------------------
 # 1. FIX IMPORT PATH
@@ -16,7 +73,9 @@ from fastapi.responses import JSONResponse
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from inference_utils import load_model, get_inference_transforms, predict_video
+    from inference_utils import (
+        load_model, warmup_model, warmup_face_detector, predict_video, STREAMING_DECODE
+    )
 except ImportError as e:
     print(f"❌ Critical Error: {e}")
     sys.exit(1)
@@ -24,7 +83,7 @@ except ImportError as e:
 # -------------------------------------------------------------------
 # 2. FASTAPI APP
 # -------------------------------------------------------------------
-app = FastAPI(title="DeepFake Sentinel API")
+app = FastAPI(title="DeepFake Sentinel API", default_response_class=DefaultResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,14 +101,13 @@ MODEL_PATH = os.path.join(BASE_DIR, "models", "best_xception_optuna.pth")
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 
 model = None
-transforms = None
 is_loading = False  # Prevent duplicate loads
 
 def load_all():
     """
     Safe lazy loading: loads the model only once.
     """
-    global model, transforms, is_loading
+    global model, is_loading
 
     if model is not None:
         return
@@ -63,10 +121,11 @@ def load_all():
 
     try:
         m = load_model(MODEL_PATH, device)
-        t = get_inference_transforms()
+        if m is not None:
+            m = warmup_model(m, device)
+            warmup_face_detector()
 
         model = m
-        transforms = t
 
         print("✅ Model loaded successfully!")
     except Exception as e:
@@ -89,7 +148,40 @@ def load_model_background():
     threading.Thread(target=_load, daemon=True).start()
 
 # -------------------------------------------------------------------
-# 5. ROUTES
+# 5. ANALYZED FRAME CACHE (opt-in: ?frame_urls=true)
+# -------------------------------------------------------------------
+# Frames are base64 in the JSON by default. With ?frame_urls=true they are
+# kept here and returned as absolute /frame/{id} URLs instead.
+# The cache is per process: run a single worker when using frame URLs.
+FRAME_CACHE_SIZE = 64
+
+frame_cache = OrderedDict()
+frame_cache_lock = threading.Lock()
+
+# One inference at a time: the model is shared and already uses all cores
+inference_lock = asyncio.Semaphore(1)
+
+def save_upload(src, suffix):
+    """
+    Copies the upload to a temp file (runs in a worker thread).
+    """
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(src, tmp)
+        return tmp.name
+
+def store_frame(jpeg_bytes):
+    """
+    Keeps the JPEG in a small LRU and returns its id.
+    """
+    frame_id = uuid.uuid4().hex
+    with frame_cache_lock:
+        frame_cache[frame_id] = jpeg_bytes
+        while len(frame_cache) > FRAME_CACHE_SIZE:
+            frame_cache.popitem(last=False)
+    return frame_id
+
+# -------------------------------------------------------------------
+# 6. ROUTES
 # -------------------------------------------------------------------
 @app.get("/")
 def home():
@@ -100,9 +192,9 @@ def home():
     }
 
 @app.post("/predict_video/")
-async def predict(file: UploadFile = File(...)):
-    # Ensure model is loaded
-    load_all()
+async def predict(request: Request, file: UploadFile = File(...), frame_urls: bool = False):
+    # Ensure model is loaded (off the event loop)
+    await asyncio.to_thread(load_all)
 
     if model is None:
         return JSONResponse(
@@ -110,35 +202,61 @@ async def predict(file: UploadFile = File(...)):
             content={"error": "Model not loaded yet. Try again in a few seconds."}
         )
 
-    # Save temp file
-    suffix = os.path.splitext(file.filename)[1]
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
+    # PyAV decodes the spooled upload directly; OpenCV needs a temp file
+    tmp_path = None
+    if STREAMING_DECODE:
+        source = file.file
+    else:
+        suffix = os.path.splitext(file.filename)[1]
+        tmp_path = await asyncio.to_thread(save_upload, file.file, suffix)
+        source = tmp_path
 
     try:
-        # Run inference
-        result = predict_video(model, tmp_path, device, transforms)
+        # Run inference in a worker thread so other requests aren't blocked
+        async with inference_lock:
+            result = await asyncio.to_thread(predict_video, model, source, device)
+
+        if frame_urls:
+            frames = [str(request.url_for("get_frame", frame_id=store_frame(jpeg)))
+                      for jpeg in result["frames"]]
+        else:
+            frames = [base64.b64encode(jpeg).decode("utf-8") for jpeg in result["frames"]]
 
         return {
             "filename": file.filename,
             "label": result["label"],
             "confidence": result["confidence"],
-            "frames": result["frames"]
+            "frames": frames
         }
 
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Prediction error: {str(e)}"})
 
     finally:
-        if os.path.exists(tmp_path):
+        # Once per request (never inside the frame loop) to bound GPU footprint
+        if device.type == "cuda":
+            torch.cuda.empty_cache()
+
+        if tmp_path and os.path.exists(tmp_path):
             try:
                 os.remove(tmp_path)
             except:
                 pass
 
+@app.get("/frame/{frame_id}")
+def get_frame(frame_id: str):
+    with frame_cache_lock:
+        jpeg = frame_cache.get(frame_id)
+        if jpeg is not None:
+            frame_cache.move_to_end(frame_id)
+
+    if jpeg is None:
+        return JSONResponse(status_code=404, content={"error": "Frame not found or expired."})
+
+    return Response(content=jpeg, media_type="image/jpeg")
+
 # -------------------------------------------------------------------
-# 6. LOCAL RUN
+# 7. LOCAL RUN
 # -------------------------------------------------------------------
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,16 @@
+import sys
+import os
+
+# -------------------------------------------------------------------
+# One-off build step: python backend/export_torchscript.py [model.pth]
+# Writes <model>.ts.pt, which load_model() prefers at startup.
+# -------------------------------------------------------------------
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from inference_utils import export_torchscript
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.path.join(BASE_DIR, "models", "best_xception_optuna.pth")
+
+if __name__ == "__main__":
+    export_torchscript(sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH)
@@ -1,12 +1,29 @@
+import functools
+import hashlib
+import os
+import queue
+import shutil
+import tempfile
+import threading
 import torch
+import torch.nn.functional as F
 import timm
 import cv2
 import numpy as np
-import albumentations as A
-from albumentations.pytorch import ToTensorV2
 import mediapipe as mp
-import base64
 import time
+
+try:
+    import av                     # PyAV: faster threaded decode (optional)
+except ImportError:
+    av = None
+
+try:
+    from turbojpeg import TurboJPEG   # SIMD libjpeg-turbo encoder (optional)
+    _turbo_jpeg = TurboJPEG()
+except Exception:                 # Package or native libturbojpeg missing
+    _turbo_jpeg = None
+
 # ===========================
 # 1. MODEL ARCHITECTURE
 # ===========================
@@ -22,29 +39,329 @@ def build_model(num_classes=2):
     return model
 
 
+def strip_dropout(model):
+    """
+    Dropout is an identity at eval time, so it is removed from the head
+    (after the weights are loaded, since it shifts the fc.* indices).
+    Linear → ReLU → Linear can't be folded into one Linear because of the ReLU.
+    """
+    model.fc = torch.nn.Sequential(
+        *[layer for layer in model.fc if not isinstance(layer, torch.nn.Dropout)]
+    )
+    return model
+
+
+def torchscript_path(model_path):
+    """
+    best_xception_optuna.pth → best_xception_optuna.ts.pt
+    """
+    return os.path.splitext(model_path)[0] + ".ts.pt"
+
+
+def checkpoint_hash(model_path):
+    """
+    SHA-256 of the checkpoint, embedded in the TorchScript export so a
+    retrained .pth never gets served through a stale trace.
+    """
+    digest = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_torchscript(model_path):
+    """
+    One-off build step: traces the FP32 model on CPU and saves it next to
+    the checkpoint so load_model() can skip building + compiling it.
+    """
+    model = build_model()
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+    model.eval()
+    strip_dropout(model)
+
+    with torch.inference_mode():
+        traced = torch.jit.trace(model, torch.zeros(1, 3, IMG_SIZE, IMG_SIZE))
+
+    out_path = torchscript_path(model_path)
+    torch.jit.save(traced, out_path,
+                   _extra_files={"checkpoint_sha256": checkpoint_hash(model_path)})
+    print(f"✅ TorchScript exported: {out_path}")
+    return out_path
+
+
+def load_torchscript(ts_path, model_path, device):
+    """
+    Loads the traced model and freezes it for inference (no JIT warm-up needed).
+    Returns None if it was exported from a different checkpoint.
+    Unlike the eager path, this skips channels_last weights, CPU int8
+    quantization of the head and torch.compile; on CUDA it still runs in FP16.
+    """
+    extra_files = {"checkpoint_sha256": ""}
+    model = torch.jit.load(ts_path, map_location=device, _extra_files=extra_files)
+    exported_hash = extra_files["checkpoint_sha256"]
+    if isinstance(exported_hash, bytes):
+        exported_hash = exported_hash.decode()
+    if exported_hash != checkpoint_hash(model_path):
+        print(f"⚠️ {ts_path} was exported from a different checkpoint, ignoring it")
+        return None
+
+    model.eval()
+    if device.type == "cuda":
+        model = model.half()
+    return torch.jit.optimize_for_inference(model)
+
+
 def load_model(model_path, device):
+    ts_path = torchscript_path(model_path)
+    if os.path.exists(ts_path):
+        try:
+            model = load_torchscript(ts_path, model_path, device)
+            if model is not None:
+                dtype = "FP16" if device.type == "cuda" else "FP32"
+                print(f"✅ Model loaded via TorchScript ({dtype}, no channels_last/int8/compile): "
+                      f"{ts_path}")
+                return model
+        except Exception as e:
+            print(f"⚠️ Could not load TorchScript model, rebuilding: {e}")
+
     try:
         model = build_model()
         checkpoint = torch.load(model_path, map_location=device)
         model.load_state_dict(checkpoint)
-        model.to(device)
+        model.to(device, memory_format=torch.channels_last)
         model.eval()
-        print(f"✅ Model loaded: {model_path}")
-        return model
+        strip_dropout(model)
+        model = optimize_precision(model, device)
+        print(f"✅ Model loaded via eager build + torch.compile: {model_path}")
+        return compile_model(model, device)
     except Exception as e:
         print(f"❌ Error loading model: {e}")
         return None
 
 
+def inference_dtype(device):
+    """
+    Input dtype expected by the model returned from load_model().
+    """
+    return torch.float16 if device.type == "cuda" else torch.float32
+
+
+def optimize_precision(model, device):
+    """
+    GPU → FP16 weights (tensor cores, half the bandwidth).
+    CPU → dynamic int8 quantization of the Linear head
+          (quantize_dynamic does not support Conv2d).
+    """
+    if device.type == "cuda":
+        return model.half()
+
+    try:
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    except Exception as e:
+        print(f"⚠️ int8 quantization unavailable, keeping FP32: {e}")
+        return model
+
+
+def compile_model(model, device):
+    """
+    Wraps the model with torch.compile (kernel fusion + less Python overhead).
+    Compilation is lazy, so the real cost is paid by warmup_model().
+    """
+    if not hasattr(torch, "compile"):
+        return model
+
+    try:
+        # Default mode, not "reduce-overhead": CUDA-graph trees are thread-local,
+        # but warmup runs on the loader thread and requests on to_thread workers.
+        if device.type == "cuda":
+            # Static shapes: batches are padded to BATCH_BUCKETS, one graph per bucket
+            return torch.compile(model, fullgraph=False, dynamic=False)
+        # CPU: a single graph with a dynamic batch dimension, batches run unpadded
+        return torch.compile(model, fullgraph=False, dynamic=True)
+    except Exception as e:
+        print(f"⚠️ torch.compile unavailable, using eager model: {e}")
+        return model
+
+
+WARMUP_RUNS = 3                   # Per bucket on GPU (compile + cuDNN autotune)
+WARMUP_SIZES = (1, 2, 8)          # Unpadded batches: size 1 is specialized, >=2 share a graph
+
+
+def pads_batches(model, device):
+    """
+    Padding to BATCH_BUCKETS only pays off for the static-shape compiled
+    graph on CUDA; eager, TorchScript and CPU models run the exact batch.
+    """
+    return device.type == "cuda" and hasattr(model, "_orig_mod")
+
+
+def _run_warmup(model, device):
+    pad = pads_batches(model, device)
+    runs = WARMUP_RUNS if device.type == "cuda" else 1
+
+    # cuDNN autotunes per input shape: only enable it when shapes are fixed
+    # (padded buckets), all of which are benchmarked below
+    if device.type == "cuda":
+        torch.backends.cudnn.benchmark = pad
+
+    with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16,
+                                                enabled=device.type == "cuda"):
+        for size in (BATCH_BUCKETS if pad else WARMUP_SIZES):
+            dummy = torch.zeros(size, 3, IMG_SIZE, IMG_SIZE, device=device,
+                                dtype=inference_dtype(device))
+            dummy = dummy.contiguous(memory_format=torch.channels_last)
+            for _ in range(runs):
+                model(dummy)
+
+
+def warmup_model(model, device):
+    """
+    Runs dummy forwards at every batch size a request can produce (the
+    padded BATCH_BUCKETS, or WARMUP_SIZES when unpadded) so JIT compilation
+    and cuDNN algorithm selection happen before the first request.
+    Falls back to the eager model if compilation fails on this machine.
+    """
+    try:
+        _run_warmup(model, device)
+        return model
+    except Exception as e:
+        print(f"⚠️ Compiled warmup failed, falling back to eager model: {e}")
+
+    eager = getattr(model, "_orig_mod", model)
+    try:
+        _run_warmup(eager, device)
+    except Exception as e:
+        print(f"⚠️ Eager warmup failed: {e}")
+    return eager
+
+
 # ===========================
 # 2. PREPROCESSING
 # ===========================
-def get_inference_transforms():
-    return A.Compose([
-        A.Resize(224, 224),
-        A.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
-        ToTensorV2()
-    ])
+IMG_SIZE = 224
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+@functools.lru_cache(maxsize=None)
+def _norm_stats(device):
+    """
+    ImageNet mean/std scaled to the 0-255 range, cached per device.
+    """
+    mean = torch.tensor(MEAN, device=device).view(1, 3, 1, 1) * 255
+    std = torch.tensor(STD, device=device).view(1, 3, 1, 1) * 255
+    return mean, std
+
+
+# On CUDA, compiled batches are padded up to one of these sizes, so the
+# static graphs and cuDNN autotuning only ever see a few shapes, all warmed up
+BATCH_BUCKETS = (4, 8, 16, 32)
+MAX_BATCH = BATCH_BUCKETS[-1]     # Larger batches are split into chunks
+
+
+def batch_bucket(n):
+    """
+    Smallest padded batch size that fits `n` faces (n <= MAX_BATCH).
+    """
+    return next(size for size in BATCH_BUCKETS if size >= n)
+
+_HOST_BUF = None                  # Persistent pinned staging buffer (CUDA only)
+_BATCH_BUFS = {}                  # device → persistent model-input buffer
+_BUFFER_LOCK = threading.Lock()   # Held by run_batch() while the buffers are in use
+
+
+def _pinned_buffer(numel):
+    """
+    Returns a pinned uint8 host buffer of at least `numel` bytes, grown on demand.
+    Only use under _BUFFER_LOCK; run_batch() syncs on .cpu() before releasing it.
+    """
+    global _HOST_BUF
+    if _HOST_BUF is None or _HOST_BUF.numel() < numel:
+        _HOST_BUF = torch.empty(numel, dtype=torch.uint8, pin_memory=True)
+    return _HOST_BUF[:numel]
+
+
+def _batch_buffer(n, device):
+    """
+    Returns an (n, 3, 224, 224) channels_last view of a persistent buffer in
+    the model's input dtype; preprocess_faces() writes into it directly.
+    Grown on demand; only use under _BUFFER_LOCK (run_batch() syncs before
+    releasing it).
+    """
+    buf = _BATCH_BUFS.get(device)
+    if buf is None or buf.shape[0] < n:
+        buf = torch.empty((max(n, MAX_BATCH), 3, IMG_SIZE, IMG_SIZE), device=device,
+                          dtype=inference_dtype(device), memory_format=torch.channels_last)
+        _BATCH_BUFS[device] = buf
+    return buf[:n]
+
+
+def upload_faces(faces, device):
+    """
+    CUDA only: moves RGB uint8 face crops to the device by packing them into
+    one pinned buffer and sending it with a single async copy.
+    """
+    sizes = [face.size for face in faces]
+    host = _pinned_buffer(sum(sizes))
+
+    offset = 0
+    for face, n in zip(faces, sizes):
+        np.copyto(host[offset:offset + n].numpy().reshape(face.shape), face)
+        offset += n
+
+    dev = host.to(device, non_blocking=True)
+
+    uploaded = []
+    offset = 0
+    for face, n in zip(faces, sizes):
+        uploaded.append(dev[offset:offset + n].view(face.shape))
+        offset += n
+    return uploaded
+
+
+def _resize_faces_cpu(faces):
+    """
+    CPU path: resize the uint8 crops with OpenCV into one NHWC uint8 array,
+    so only 224x224 pixels are ever converted to float.
+    Returned as a zero-copy (N, 3, 224, 224) uint8 view.
+    """
+    batch = np.empty((len(faces), IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+    for i, face in enumerate(faces):
+        batch[i] = cv2.resize(face, (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_LINEAR)
+    return torch.from_numpy(batch).permute(0, 3, 1, 2)
+
+
+def preprocess_faces(faces, device, pad=False):
+    """
+    Turns a list of RGB uint8 face crops (variable sizes, at most MAX_BATCH)
+    into one normalized (B, 3, 224, 224) batch on the target device, where
+    B = batch_bucket(len(faces)) if `pad` (padding rows are zero), else len(faces).
+    The result is written straight into the persistent channels_last buffer.
+    On GPU, crops go to the device as uint8 and resize + normalize run there.
+    """
+    n = len(faces)
+    padded = _batch_buffer(batch_bucket(n) if pad else n, device)
+    mean, std = _norm_stats(device)
+
+    if device.type == "cpu":
+        # uint8 NCHW view → float NHWC buffer: one converting copy, then
+        # normalize in place (the buffer is FP32 on CPU)
+        padded[:n].copy_(_resize_faces_cpu(faces))
+        padded[:n].sub_(mean).div_(std)
+    else:
+        # Normalize each face in FP32, then cast into its FP16 buffer slot
+        for i, face in enumerate(upload_faces(faces, device)):
+            resized = F.interpolate(
+                face.permute(2, 0, 1).unsqueeze(0).float(),
+                size=(IMG_SIZE, IMG_SIZE), mode="bilinear", align_corners=False
+            )
+            padded[i:i + 1].copy_(resized.sub_(mean).div_(std))
+
+    padded[n:].zero_()
+    return padded
 
 
 # ===========================
@@ -57,13 +374,22 @@ mp_face_detection = mp.solutions.face_detection.FaceDetection(
 )
 
 
-def extract_faces_with_bbox(frame_bgr):
+def warmup_face_detector():
+    """
+    Initializes MediaPipe's TFLite graph so the first request doesn't pay for it.
+    """
+    mp_face_detection.process(np.zeros((480, 640, 3), np.uint8))
+
+
+def extract_faces_with_bbox(frame_bgr, rgb_buf=None):
     """
     Returns a list of: (face_crop, (x, y, w, h))
     Robust version for Render deployment.
+    If `rgb_buf` is given, the RGB conversion is written into it (no
+    per-frame allocation) and the crops are copied out of it.
     """
 
-    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+    frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=rgb_buf)
     results = mp_face_detection.process(frame_rgb)
     faces_data = []
 
@@ -90,92 +416,512 @@ def extract_faces_with_bbox(frame_bgr):
         if face.size == 0 or (x2-x1) < 30 or (y2-y1) < 30:
             continue
 
+        if rgb_buf is not None:
+            face = face.copy()    # rgb_buf is overwritten by the next frame
+
         faces_data.append((face, (x1, y1, x2-x1, y2-y1)))
 
     return faces_data
 
 
-def encode_frame_to_base64(frame):
-    _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-    return base64.b64encode(buffer).decode('utf-8')
+MOTION_THRESHOLD = 4.0            # Mean abs luma diff (0-255) on the thumbnail
+MAX_REUSE = 4                     # Re-run detection at least every N+1 frames
+THUMB_SIZE = (64, 64)
+
+
+class MotionGatedDetector:
+    """
+    Wraps extract_faces_with_bbox() for one video.
+    If a frame barely differs from the last *detected* frame, the previous
+    boxes are reused and MediaPipe is skipped for that frame.
+    """
+
+    def __init__(self, threshold=MOTION_THRESHOLD, max_reuse=MAX_REUSE):
+        self.threshold = threshold
+        self.max_reuse = max_reuse
+        self.last_thumb = None
+        self.last_bboxes = []
+        self.reuse_count = 0
+        self.rgb_buf = None
+
+    def _rgb_buffer(self, frame_bgr):
+        if self.rgb_buf is None or self.rgb_buf.shape != frame_bgr.shape:
+            self.rgb_buf = np.empty_like(frame_bgr)
+        return self.rgb_buf
+
+    def _thumbnail(self, frame_bgr):
+        small = cv2.resize(frame_bgr, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def __call__(self, frame_bgr):
+        thumb = self._thumbnail(frame_bgr)
+
+        if (self.last_thumb is not None
+                and self.reuse_count < self.max_reuse
+                and cv2.absdiff(thumb, self.last_thumb).mean() < self.threshold):
+            self.reuse_count += 1
+            # Only the crops are converted to RGB, not the whole frame
+            return [
+                (cv2.cvtColor(frame_bgr[y:y+h, x:x+w], cv2.COLOR_BGR2RGB), (x, y, w, h))
+                for (x, y, w, h) in self.last_bboxes
+            ]
+
+        faces_data = extract_faces_with_bbox(frame_bgr, self._rgb_buffer(frame_bgr))
+        self.last_thumb = thumb
+        self.last_bboxes = [bbox for _, bbox in faces_data]
+        self.reuse_count = 0
+        return faces_data
+
+
+JPEG_QUALITY = 80
+
+
+def encode_jpeg(frame_bgr):
+    """
+    Returns the frame as JPEG bytes (served as-is, no base64).
+    """
+    if _turbo_jpeg is not None:
+        return _turbo_jpeg.encode(frame_bgr, quality=JPEG_QUALITY)
+
+    _, buffer = cv2.imencode('.jpg', frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+    return buffer.tobytes()
+
+
+# ===========================
+# 4. AGGREGATION
+# ===========================
+
+SCORE_PERCENTILE = 70
+
+
+def aggregate_score(predictions):
+    """
+    Video-level fake score: exact 70th percentile of the per-face
+    probabilities. At most MAX_FRAMES frames are sampled, so keeping
+    every value is cheap and the verdict doesn't depend on frame order.
+    """
+    return float(np.percentile(predictions, SCORE_PERCENTILE))
 
 
 # ===========================
-# 4. MAIN VIDEO INFERENCE
+# 5. VIDEO DECODING
 # ===========================
 
-def predict_video(model, video_path, device, transform):
-    cap = cv2.VideoCapture(video_path)
+DENSE_FRAMES = 30                 # Process every frame up to here...
+SAMPLE_EVERY = 5                  # ...then every Nth frame
+
+
+MAX_DECODE_WIDTH = 1280          # Larger (e.g. 4K) inputs are downscaled while decoding
+
+
+def decode_threads():
+    """
+    FFmpeg codec threads: half of torch's CPU budget (set from CPU_THREADS
+    in app.py), since detection and the forward pass run alongside decoding.
+    """
+    return max(1, torch.get_num_threads() // 2)
+
+
+def should_sample(frame_count):
+    return frame_count <= DENSE_FRAMES or frame_count % SAMPLE_EVERY == 0
+
+
+def decode_size(width, height):
+    """
+    Target (width, height) for a frame, or None if it is already small enough.
+    """
+    if width <= MAX_DECODE_WIDTH:
+        return None
+    return MAX_DECODE_WIDTH, int(round(height * MAX_DECODE_WIDTH / width))
+
+
+# Display-matrix angle (counterclockwise, degrees) → cv2.rotate code
+_ROTATIONS = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_CLOCKWISE,
+}
+
+
+def _av_rotation(stream, frame):
+    """
+    Rotation from the DISPLAYMATRIX side data (e.g. portrait phone videos).
+    OpenCV applies it automatically, PyAV's to_ndarray() does not.
+    """
+    rotation = getattr(frame, "rotation", None)                      # PyAV >= 13
+    if rotation is None:
+        rotation = getattr(stream, "side_data", {}).get("DISPLAYMATRIX", 0)  # older PyAV
+    return int(round(rotation or 0)) % 360
+
+
+def _iter_frames_av(container, max_frames):
+    try:
+        stream = container.streams.video[0]
+        # Threaded decode, capped: "AUTO" alone would start one FFmpeg thread
+        # per host core on top of the detect/infer pipeline threads
+        stream.thread_type = "AUTO"
+        stream.codec_context.thread_count = decode_threads()
+
+        for frame_count, frame in enumerate(container.decode(stream), start=1):
+            if frame_count > max_frames:
+                print("⚠️ MAX FRAME LIMIT REACHED")
+                break
+
+            # Skipped frames are decoded but never converted to BGR
+            if not should_sample(frame_count):
+                continue
+
+            # The width cap applies to the displayed (upright) frame, as with
+            # OpenCV, which rotates before we resize
+            rotation = _av_rotation(stream, frame)
+            sideways = rotation in (90, 270)
+            if sideways:
+                size = decode_size(frame.height, frame.width)
+                size = size and (size[1], size[0])
+            else:
+                size = decode_size(frame.width, frame.height)
+
+            # swscale resizes and converts to BGR in one pass
+            if size is None:
+                image = frame.to_ndarray(format="bgr24")
+            else:
+                image = frame.to_ndarray(width=size[0], height=size[1], format="bgr24")
+
+            # Upright frames, like OpenCV's CAP_PROP_ORIENTATION_AUTO
+            rotate_code = _ROTATIONS.get(rotation)
+            if rotate_code is not None:
+                image = cv2.rotate(image, rotate_code)
+
+            yield frame_count, image
+    finally:
+        container.close()
+
+
+def _iter_frames_cv2(cap, max_frames):
+    try:
+        frame_count = 0
+        while True:
+            if not cap.grab():
+                break
+
+            frame_count += 1
+            if frame_count > max_frames:
+                print("⚠️ MAX FRAME LIMIT REACHED")
+                break
+
+            # grab() only demuxes/decodes; retrieve() is skipped for unused frames
+            if not should_sample(frame_count):
+                continue
+
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+
+            size = decode_size(frame.shape[1], frame.shape[0])
+            if size is not None:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+            yield frame_count, frame
+    finally:
+        cap.release()
+
+
+def _iter_and_remove(frames, path):
+    """
+    Yields from `frames`, then deletes the temp file they were decoded from.
+    """
+    try:
+        yield from frames
+    finally:
+        frames.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _open_cv2_fileobj(fileobj, max_frames):
+    """
+    OpenCV needs a path: spool the file object to disk and decode from there.
+    """
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False) as tmp:
+        shutil.copyfileobj(fileobj, tmp)
+
+    cap = cv2.VideoCapture(tmp.name)
     if not cap.isOpened():
-        return {"label": "Error", "confidence": 0.0, "frames": []}
+        os.remove(tmp.name)
+        return None
+    return _iter_and_remove(_iter_frames_cv2(cap, max_frames), tmp.name)
 
-    predictions = []
-    analyzed_frames = []
-    frame_count = 0
 
-    MAX_FRAMES = 80               # Hard limit → prevents Render freeze
-    SAVE_LIMIT = 4                # Max frames saved for UI
-    START_TIME = time.time()
-    TIME_LIMIT = 15               # 15 seconds max inference time
+# PyAV can decode straight from a seekable file object (e.g. the upload)
+STREAMING_DECODE = av is not None
 
-    while True:
-        # ---------- TIMEOUT ----------
-        if time.time() - START_TIME > TIME_LIMIT:
-            print("⛔ TIMEOUT: Returning partial results")
-            break
 
-        ret, frame = cap.read()
-        if not ret:
-            break
+def open_video(video, max_frames):
+    """
+    Returns a generator of (frame_index, frame_bgr) for sampled frames,
+    or None if the video cannot be opened. Prefers PyAV, falls back to OpenCV.
+    `video` is a path, or a seekable binary file object when STREAMING_DECODE.
+    """
+    if av is not None:
+        try:
+            container = av.open(video)
+            if container.streams.video:
+                return _iter_frames_av(container, max_frames)
+            container.close()
+        except Exception as e:
+            print(f"⚠️ PyAV could not open video, falling back to OpenCV: {e}")
+
+    if not isinstance(video, str):
+        return _open_cv2_fileobj(video, max_frames)
+
+    cap = cv2.VideoCapture(video)
+    if not cap.isOpened():
+        return None
+    return _iter_frames_cv2(cap, max_frames)
 
-        frame_count += 1
 
-        # ---------- Stop after MAX_FRAMES ----------
-        if frame_count > MAX_FRAMES:
-            print("⚠️ MAX FRAME LIMIT REACHED")
-            break
+# ===========================
+# 6. MAIN VIDEO INFERENCE
+# ===========================
 
-        # Process first 30 frames, then sample every 5th
-        if frame_count > 30 and (frame_count % 5 != 0):
+BATCH_FRAMES = 8                  # Sampled frames whose faces share one forward pass
+QUEUE_SIZE = 4                    # Max frames buffered between pipeline stages
+EARLY_EXIT_MIN_SAMPLES = 20       # Faces needed before trusting the running score
+EARLY_EXIT_FAKE = 0.9             # Stop once the running p70 is this sure...
+EARLY_EXIT_REAL = 0.1             # ...either way
+_END = object()                   # End-of-stream marker passed between stages
+
+cv2.setNumThreads(1)              # Pipeline threads already use the cores
+
+
+def _put(q, item, stop):
+    """
+    Blocking put that gives up once `stop` is set (consumer went away).
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
             continue
 
-        faces_data = extract_faces_with_bbox(frame)
-        vis_frame = frame.copy()
 
-        if len(faces_data) == 0:
+def _get(q, stop):
+    """
+    Blocking get that returns _END once `stop` is set.
+    """
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
             continue
+    return _END
 
-        for face, (x, y, w, h) in faces_data:
-            try:
-                processed = transform(image=face)["image"].unsqueeze(0).to(device)
 
-                with torch.no_grad():
-                    output = model(processed)
-                    probs = torch.softmax(output, dim=1)
-                    fake_prob = probs[0, 1].item()
-                    predictions.append(fake_prob)
+def _decode_stage(frames, decode_q, stop, errors):
+    """
+    Thread A: decodes sampled frames into decode_q.
+    A decode error after the first frame (truncated upload, corrupt tail
+    packet) ends the stream with partial results, like a failed cap.read().
+    """
+    decoded = 0
+    try:
+        for _, frame in frames:
+            if stop.is_set():
+                break
+            _put(decode_q, frame, stop)
+            decoded += 1
+    except Exception as e:
+        if decoded:
+            print(f"⚠️ Decode error after {decoded} frames, using partial results: {e}")
+        else:
+            print(f"❌ Decode error: {e}")
+            errors.append(e)
+    finally:
+        frames.close()
+        _put(decode_q, _END, stop)
 
-                color = (0, 0, 255) if fake_prob > 0.5 else (0, 255, 0)
-                label = f"{'FAKE' if fake_prob>0.5 else 'REAL'} {fake_prob*100:.1f}%"
 
-                cv2.rectangle(vis_frame, (x, y), (x+w, y+h), color, 2)
-                cv2.putText(vis_frame, label, (x, y - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2)
+def _detect_stage(decode_q, infer_q, stop, errors):
+    """
+    Thread B: runs face detection and forwards frames that contain faces.
+    """
+    detect_faces = MotionGatedDetector()
+    try:
+        while True:
+            frame = _get(decode_q, stop)
+            if frame is _END:
+                break
+
+            faces_data = detect_faces(frame)
+            if faces_data:
+                _put(infer_q, (frame, faces_data), stop)
+    except Exception as e:
+        print(f"❌ Face detection error: {e}")
+        errors.append(e)
+    finally:
+        _put(infer_q, _END, stop)
 
-            except:
-                continue
 
-        if len(analyzed_frames) < SAVE_LIMIT:
-            h, w = vis_frame.shape[:2]
-            resized = cv2.resize(vis_frame, (480, int(h * (480 / w))))
-            analyzed_frames.append(encode_frame_to_base64(resized))
+def run_batch(model, faces, device):
+    """
+    Runs batched forward passes (split at MAX_BATCH, padded when pads_batches())
+    over a list of raw RGB face crops.
+    Returns a numpy array of fake probabilities (one per face).
+    """
+    pad = pads_batches(model, device)
+
+    probs = []
+    for start in range(0, len(faces), MAX_BATCH):
+        chunk = faces[start:start + MAX_BATCH]
+
+        # The staging/input buffers are shared by every caller in the process
+        with _BUFFER_LOCK:
+            with torch.inference_mode():
+                batch = preprocess_faces(chunk, device, pad)
+
+            with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16,
+                                                        enabled=device.type == "cuda"):
+                out = torch.softmax(model(batch).float(), dim=1)[:len(chunk), 1]
 
-    cap.release()
+            probs.append(out.cpu().numpy())
+
+    return np.concatenate(probs)
+
+
+def flush_pending(model, device, pending_faces, pending_frames, predictions, analyzed_frames):
+    """
+    Scores the pending faces in one batched forward pass and maps the
+    probabilities back to their (frame, bbox) in order.
+    `pending_frames` holds (frame or None, [bbox, ...]); None frames (past
+    SAVE_LIMIT) still consume their probabilities but are not annotated.
+    Annotated frames are appended to `analyzed_frames` as JPEG bytes.
+    Both pending lists are cleared.
+    """
+    if not pending_faces:
+        return
+
+    probs = run_batch(model, pending_faces, device).tolist()
+    predictions.extend(probs)
+
+    idx = 0
+    for vis_frame, bboxes in pending_frames:
+        if vis_frame is None:
+            idx += len(bboxes)
+            continue
+
+        for (x, y, w, h) in bboxes:
+            fake_prob = probs[idx]
+            idx += 1
+
+            color = (0, 0, 255) if fake_prob > 0.5 else (0, 255, 0)
+            label = f"{'FAKE' if fake_prob>0.5 else 'REAL'} {fake_prob*100:.1f}%"
+
+            cv2.rectangle(vis_frame, (x, y), (x+w, y+h), color, 2)
+            cv2.putText(vis_frame, label, (x, y - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255,255,255), 2)
+
+        fh, fw = vis_frame.shape[:2]
+        resized = cv2.resize(vis_frame, (480, int(fh * (480 / fw))))
+        analyzed_frames.append(encode_jpeg(resized))
+
+    pending_faces.clear()
+    pending_frames.clear()
+
+
+def predict_video(model, video, device):
+    MAX_FRAMES = 80               # Hard limit → prevents Render freeze
+    SAVE_LIMIT = 4                # Max frames saved for UI
+    START_TIME = time.time()
+    TIME_LIMIT = 15               # 15 seconds max inference time
+
+    frames = open_video(video, MAX_FRAMES)
+    if frames is None:
+        return {"label": "Error", "confidence": 0.0, "frames": []}
+
+    predictions = []              # Per-face fake probabilities
+    analyzed_frames = []
+
+    # Faces waiting for the next batched forward pass
+    pending_faces = []            # raw RGB face crops
+    pending_frames = []           # (frame or None, [bbox, ...]) in the same order
+    frames_kept = 0               # Frames already reserved for the UI
+
+    def flush():
+        flush_pending(model, device, pending_faces, pending_frames,
+                      predictions, analyzed_frames)
+
+    # ---------- decode → detect → infer pipeline ----------
+    # Decoder stops after MAX_FRAMES and only yields sampled frames
+    stop = threading.Event()
+    errors = []                   # Exceptions raised inside the worker threads
+    decode_q = queue.Queue(maxsize=QUEUE_SIZE)
+    infer_q = queue.Queue(maxsize=QUEUE_SIZE)
+    workers = [
+        threading.Thread(target=_decode_stage, args=(frames, decode_q, stop, errors),
+                         daemon=True),
+        threading.Thread(target=_detect_stage, args=(decode_q, infer_q, stop, errors),
+                         daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        while True:
+            # ---------- TIMEOUT ----------
+            if time.time() - START_TIME > TIME_LIMIT:
+                print("⛔ TIMEOUT: Returning partial results")
+                break
+
+            try:
+                item = infer_q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                break
+
+            frame, faces_data = item
+
+            # Decoded frames are owned by this loop, so annotate in place;
+            # frames past SAVE_LIMIT are dropped instead of being kept around
+            vis_frame = None
+            if frames_kept < SAVE_LIMIT:
+                vis_frame = frame
+                frames_kept += 1
+
+            for face, _ in faces_data:
+                pending_faces.append(face)
+            pending_frames.append((vis_frame, [bbox for _, bbox in faces_data]))
+
+            # ---------- Batched forward every BATCH_FRAMES frames ----------
+            if len(pending_frames) >= BATCH_FRAMES:
+                flush()
+
+                # ---------- Early exit on a clear-cut video ----------
+                if len(predictions) >= EARLY_EXIT_MIN_SAMPLES:
+                    score = aggregate_score(predictions)
+                    if score >= EARLY_EXIT_FAKE or score <= EARLY_EXIT_REAL:
+                        print(f"✅ Confident early exit after {len(predictions)} faces")
+                        break
+    finally:
+        # Always stop the workers, even if the forward pass raised
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+    # A detection failure, or a video that never decoded, is an error
+    if errors:
+        raise errors[0]
+
+    flush()
 
     if len(predictions) == 0:
         return {"label": "No Faces", "confidence": 0.0, "frames": []}
 
-    score = float(np.percentile(predictions, 70))
+    score = aggregate_score(predictions)
 
     return {
         "label": "Fake" if score > 0.5 else "Real",
@@ -0,0 +1,107 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("timm")
+pytest.importorskip("mediapipe")
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inference_utils as iu
+
+
+def test_batch_bucket_picks_smallest_fitting_size():
+    assert iu.batch_bucket(1) == 4
+    assert iu.batch_bucket(4) == 4
+    assert iu.batch_bucket(5) == 8
+    assert iu.batch_bucket(17) == 32
+    assert iu.batch_bucket(iu.MAX_BATCH) == iu.MAX_BATCH
+
+
+def test_decode_size_caps_width_and_keeps_aspect():
+    assert iu.decode_size(1280, 720) is None
+    assert iu.decode_size(640, 480) is None
+    assert iu.decode_size(3840, 2160) == (1280, 720)
+    assert iu.decode_size(1920, 1080) == (1280, 720)
+
+
+def test_should_sample_dense_then_every_fifth():
+    sampled = [i for i in range(1, 51) if iu.should_sample(i)]
+    assert sampled == list(range(1, 31)) + [35, 40, 45, 50]
+
+
+@pytest.mark.parametrize("angle, k", [(90, 1), (180, 2), (270, 3)])
+def test_rotations_match_counterclockwise_display_matrix(angle, k):
+    image = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    rotated = cv2.rotate(image, iu._ROTATIONS[angle])
+    assert np.array_equal(rotated, np.rot90(image, k))
+
+
+def test_av_rotation_reads_frame_then_stream_side_data():
+    stream = SimpleNamespace(side_data={"DISPLAYMATRIX": -90.0})
+    assert iu._av_rotation(stream, SimpleNamespace(rotation=90)) == 90
+    assert iu._av_rotation(stream, SimpleNamespace()) == 270
+    assert iu._av_rotation(SimpleNamespace(), SimpleNamespace()) == 0
+
+
+def test_strip_dropout_keeps_head_outputs():
+    torch.manual_seed(0)
+    model = torch.nn.Module()
+    model.fc = torch.nn.Sequential(
+        torch.nn.Linear(16, 8),
+        torch.nn.ReLU(),
+        torch.nn.Dropout(0.5),
+        torch.nn.Linear(8, 2)
+    )
+    model.eval()
+    x = torch.randn(4, 16)
+    expected = model.fc(x)
+
+    iu.strip_dropout(model)
+
+    assert not any(isinstance(layer, torch.nn.Dropout) for layer in model.fc)
+    assert torch.allclose(model.fc(x), expected)
+
+
+def test_flush_pending_maps_probabilities_to_frames_and_boxes(monkeypatch):
+    probs = [0.9, 0.1, 0.8, 0.3, 0.2]
+    monkeypatch.setattr(iu, "run_batch", lambda model, faces, device: np.array(probs))
+    monkeypatch.setattr(iu, "encode_jpeg", lambda frame: frame)   # keep pixels inspectable
+
+    def blank():
+        return np.zeros((360, 480, 3), np.uint8)
+
+    box_a, box_b, box_c, box_d, box_e = [(40 + 80 * i, 100, 60, 60) for i in range(5)]
+    one_face, two_faces, past_limit, last_face, no_faces = blank(), blank(), None, blank(), blank()
+    pending_frames = [
+        (one_face, [box_a]),              # 0.9 → FAKE
+        (two_faces, [box_b, box_c]),      # 0.1 → REAL, 0.8 → FAKE
+        (past_limit, [box_d]),            # 0.3 consumed, not drawn
+        (last_face, [box_e]),             # 0.2 → REAL
+        (no_faces, []),
+    ]
+    pending_faces = [np.zeros((60, 60, 3), np.uint8)] * len(probs)
+    predictions, analyzed = [], []
+
+    iu.flush_pending(None, None, pending_faces, pending_frames, predictions, analyzed)
+
+    fake, real = (0, 0, 255), (0, 255, 0)
+
+    def edge(frame, box):
+        x, y, w, h = box
+        return tuple(frame[y + h // 2, x + w])
+
+    assert predictions == probs
+    assert len(analyzed) == 4
+    assert edge(analyzed[0], box_a) == fake
+    assert edge(analyzed[1], box_b) == real
+    assert edge(analyzed[1], box_c) == fake
+    assert edge(analyzed[2], box_e) == real
+    assert edge(analyzed[2], box_d) == (0, 0, 0)
+    assert not analyzed[3].any()
+    assert pending_faces == [] and pending_frames == []